@@ -1,13 +1,43 @@
+import io
 import math
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import date, timedelta
 from typing import Dict, List, Tuple, Optional
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import requests_cache
+except ImportError:  # optional: without it every run goes to JPL
+    requests_cache = None
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib JSON parser
+    orjson = None
 
 HORIZONS_API = "https://ssd.jpl.nasa.gov/api/horizons.api"
 
+# Horizons caps the number of output lines per ephemeris request.
+_MAX_ROWS_PER_QUERY = 90000
+
+# Upper bound on simultaneous Horizons requests (be polite to JPL).
+_MAX_CONCURRENT_REQUESTS = 4
+
+# Ephemeris data block of a Horizons 'result' text.
+_BLOCK_RE = re.compile(r"\$\$SOE(?P<block>.*?)\$\$EOE", re.S)
+
+# Pooled keep-alive connections per host, enough for the concurrent fetches.
+_POOL_SIZE = 16
+
+# SQLite file used to persist Horizons responses when requests_cache is available.
+HORIZONS_CACHE_PATH = "horizons.sqlite"
+
 # Horizons major-body IDs (COMMAND)
 PLANET_IDS = {
     "Mercury": "199",
@@ -34,90 +64,223 @@ def _circular_span_deg(angles_deg: List[float]) -> float:
     if not angles_deg:
         return 0.0
     a = sorted([x % 360.0 for x in angles_deg])
-    if len(a) == 1:
-        return 0.0
-    # Find the largest gap between consecutive angles (including wrap-around).
-    gaps = []
-    for i in range(len(a) - 1):
-        gaps.append(a[i + 1] - a[i])
-    gaps.append((a[0] + 360.0) - a[-1])  # wrap gap
-    largest_gap = max(gaps)
+    # Find the largest gap between consecutive angles in one pass, starting
+    # from the wrap-around gap (last angle -> first angle + 360). A single
+    # angle yields a 360-degree gap, i.e. span 0.
+    prev = a[-1] - 360.0
+    largest_gap = 0.0
+    for x in a:
+        if x - prev > largest_gap:
+            largest_gap = x - prev
+        prev = x
     return 360.0 - largest_gap
 
-def _parse_lon_from_result_text(result_text: str) -> float:
+def _circular_span_deg_batch(
+    angles_deg: np.ndarray,
+    max_span_deg: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Row-wise _circular_span_deg: angles_deg has shape (days, planets) and the
+    result holds one minimal covering arc per day.
+
+    If max_span_deg (< 180) is given, no sort is needed. With
+    z = sum(exp(i*lon)), points inside an arc of width s <= 180 have mean
+    resultant length |z| / N >= cos(s/2), so days below that bound are
+    reported as inf. For the rest the mean direction arg(z) lies inside any
+    such arc; measuring angles relative to it removes the wrap-around, and
+    max - min is the span. Values above max_span_deg are then only upper
+    bounds, but every value <= max_span_deg is exact.
+    """
+    angles_deg = np.asarray(angles_deg, dtype=float)
+    n_days, n_planets = angles_deg.shape
+    if n_planets == 0:
+        return np.zeros(n_days)
+
+    if max_span_deg is None or max_span_deg >= 180.0:
+        a = np.sort(angles_deg % 360.0, axis=1)
+        gaps = np.diff(a, axis=1)
+        wrap = (a[:, 0] + 360.0) - a[:, -1]
+        all_gaps = np.concatenate([gaps, wrap[:, None]], axis=1)
+        return 360.0 - all_gaps.max(axis=1)
+
+    rad = np.radians(angles_deg)
+    z = np.exp(1j * rad).sum(axis=1)
+    # Small tolerance keeps the bound sound under rounding.
+    rows = np.flatnonzero(np.abs(z) / n_planets >= math.cos(math.radians(max_span_deg) / 2.0) - 1e-9)
+
+    spans = np.full(n_days, np.inf)
+    delta = (rad[rows] - np.angle(z[rows])[:, None] + math.pi) % (2.0 * math.pi) - math.pi
+    spans[rows] = np.degrees(delta.max(axis=1) - delta.min(axis=1))
+    return spans
+
+def _new_session() -> requests.Session:
     """
-    Parse ecliptic longitude from Horizons 'result' text when CSV_FORMAT=YES and QUANTITIES=31.
-    We request a single day (START=STOP-STEP), so we take the first data line inside $$SOE/$$EOE.
+    Session for Horizons requests. If requests_cache is installed, responses are
+    stored in HORIZONS_CACHE_PATH and never expire (ephemerides for a past query
+    do not change), so re-running a scan does not hit JPL again.
+
+    Connections are pooled and kept alive, and throttling/5xx responses
+    (Horizons returns an occasional 503) are retried with backoff.
+    """
+    if requests_cache is not None:
+        s = requests_cache.CachedSession(HORIZONS_CACHE_PATH, backend="sqlite", expire_after=-1)
+    else:
+        s = requests.Session()
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    s.mount("https://", HTTPAdapter(pool_connections=_POOL_SIZE, pool_maxsize=_POOL_SIZE,
+                                    max_retries=retry))
+    s.headers["Accept-Encoding"] = "gzip"
+    return s
+
+def _load_json(r: requests.Response) -> dict:
+    """
+    Decode a Horizons JSON response. The payload is one large 'result' string,
+    which orjson parses noticeably faster than the stdlib decoder.
+    """
+    if orjson is not None:
+        return orjson.loads(r.content)
+    return r.json()
+
+def _parse_lons_from_result_text(result_text: str) -> np.ndarray:
+    """
+    Parse ecliptic longitudes from Horizons 'result' text when CSV_FORMAT=YES and QUANTITIES=31.
+    Every data line inside $$SOE/$$EOE is one step of the requested range.
     """
     # Extract lines between $$SOE and $$EOE
-    m = re.search(r"\$\$SOE(.*?)\$\$EOE", result_text, flags=re.S)
+    m = _BLOCK_RE.search(result_text)
     if not m:
         raise ValueError("Could not find $$SOE/$$EOE block in Horizons response.")
-    block = m.group(1).strip()
-
-    # Find first non-empty line that looks like CSV data (ignore headers)
-    lines = [ln.strip() for ln in block.splitlines() if ln.strip()]
-    if not lines:
+    block = m.group("block").strip()
+    if not block:
         raise ValueError("No ephemeris data lines found in $$SOE block.")
 
-    # If CSV_FORMAT=YES, line is comma-separated. Quantity 31 includes:
-    # ... "EclLon", "EclLat" (names vary), but we’ll take the first numeric pair at the end.
-    # Safer: split by comma and pick last two fields that can be floats.
-    parts = [p.strip() for p in lines[0].split(",")]
-
-    floats = []
-    for p in reversed(parts):
-        try:
-            floats.append(float(p))
-        except ValueError:
-            continue
-        if len(floats) >= 2:
-            break
-    if len(floats) < 2:
-        raise ValueError(f"Could not parse ecliptic lon/lat from line: {lines[0]}")
-
-    ecl_lat = floats[0]
-    ecl_lon = floats[1]
-    return ecl_lon % 360.0
-
-def fetch_geocentric_ecliptic_longitude(
+    # The CSV header is the last comma-separated line above $$SOE (a row of
+    # asterisks sits in between). Quantity 31 labels its columns e.g.
+    # "ObsEcLon", "ObsEcLat"; the names vary, so match on LON/LAT.
+    header = next((ln for ln in reversed(result_text[:m.start()].splitlines()) if "," in ln), "")
+    names = [h.strip().upper() for h in header.split(",")]
+    lon_col = next((i for i, name in enumerate(names) if "LON" in name), None)
+    lat_col = next((i for i, name in enumerate(names) if "LAT" in name), None)
+    if lon_col is None or lat_col is None:
+        raise ValueError(f"Could not locate ecliptic lon/lat columns in header: {header!r}")
+
+    data = np.loadtxt(io.StringIO(block), delimiter=",",
+                      usecols=(lon_col, lat_col), ndmin=2)
+    return data[:, 0] % 360.0
+
+def fetch_geocentric_ecliptic_longitude_range(
     body_id: str,
-    day: date,
+    start_day: date,
+    end_day: date,
+    step_days: int = 1,
     session: Optional[requests.Session] = None,
-) -> float:
+) -> np.ndarray:
     """
-    Fetch observer-centered Earth ecliptic longitude for the target body on given date (UTC).
+    Fetch observer-centered Earth ecliptic longitudes for the target body on
+    start_day, start_day + step_days, ... up to end_day inclusive (UTC).
+    Element i of the returned array belongs to start_day + i * step_days.
+
     Uses EPHEM_TYPE=OBSERVER, CENTER='500@399' (Earth geocenter),
     QUANTITIES='31' (Observer-centered Earth ecliptic lon/lat),
-    CSV_FORMAT=YES for easier parsing.
-    """
-    s = session or requests.Session()
-
-    start = day.isoformat()
-    stop = (day + timedelta(days=1)).isoformat()
-
-    params = {
-        "format": "json",
-        "COMMAND": f"'{body_id}'",
-        "OBJ_DATA": "NO",
-        "MAKE_EPHEM": "YES",
-        "EPHEM_TYPE": "OBSERVER",
-        "CENTER": "'500@399'",     # geocenter @ Earth
-        "START_TIME": f"'{start}'",
-        "STOP_TIME": f"'{stop}'",
-        "STEP_SIZE": "'30 d'",
-        "QUANTITIES": "'31'",      # Observer-centered Earth ecliptic lon/lat
-        "CSV_FORMAT": "YES",
-        "CAL_FORMAT": "CAL",
-        "TIME_DIGITS": "MINUTES",
-    }
-
-    r = s.get(HORIZONS_API, params=params, timeout=30)
-    r.raise_for_status()
-    data = r.json()
-    if "result" not in data:
-        raise ValueError(f"Unexpected Horizons response: {data.keys()}")
-    return _parse_lon_from_result_text(data["result"])
+    CSV_FORMAT=YES for easier parsing. One request covers up to
+    _MAX_ROWS_PER_QUERY steps; longer windows are split into sub-ranges.
+    """
+    if session is None:
+        with _new_session() as s:
+            return fetch_geocentric_ecliptic_longitude_range(body_id, start_day, end_day,
+                                                             step_days, session=s)
+
+    n_steps = (end_day - start_day).days // step_days + 1
+    if n_steps <= 0:
+        return np.empty(0)
+
+    chunks = []
+    for first in range(0, n_steps, _MAX_ROWS_PER_QUERY):
+        count = min(_MAX_ROWS_PER_QUERY, n_steps - first)
+        start = start_day + timedelta(days=first * step_days)
+        # Horizons needs STOP > START, so ask for one extra step and drop it.
+        stop = start + timedelta(days=count * step_days)
+
+        params = {
+            "format": "json",
+            "COMMAND": f"'{body_id}'",
+            "OBJ_DATA": "NO",
+            "MAKE_EPHEM": "YES",
+            "EPHEM_TYPE": "OBSERVER",
+            "CENTER": "'500@399'",     # geocenter @ Earth
+            "START_TIME": f"'{start.isoformat()}'",
+            "STOP_TIME": f"'{stop.isoformat()}'",
+            "STEP_SIZE": f"'{step_days} d'",
+            "QUANTITIES": "'31'",      # Observer-centered Earth ecliptic lon/lat
+            "CSV_FORMAT": "YES",
+            "CAL_FORMAT": "CAL",
+            "TIME_DIGITS": "MINUTES",
+        }
+
+        r = session.get(HORIZONS_API, params=params, timeout=30)
+        r.raise_for_status()
+        data = _load_json(r)
+        if "result" not in data:
+            raise ValueError(f"Unexpected Horizons response: {data.keys()}")
+        lons = _parse_lons_from_result_text(data["result"])
+        if len(lons) < count:
+            raise ValueError(f"Horizons returned {len(lons)} rows, expected {count}.")
+        chunks.append(lons[:count])
+
+    return np.concatenate(chunks)
+
+def _check_planets(planets: List[str]) -> None:
+    for p in planets:
+        if p not in PLANET_IDS:
+            raise ValueError(f"Unknown planet name: {p}. Available: {list(PLANET_IDS.keys())}")
+
+def fetch_all_planets_range(
+    planets: List[str],
+    start_day: date,
+    end_day: date,
+    step_days: int = 1,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Run fetch_geocentric_ecliptic_longitude_range for every planet over the same
+    window and return {planet: longitudes}. Horizons takes one body per
+    ephemeris query, so the per-planet range queries are issued concurrently
+    (at most _MAX_CONCURRENT_REQUESTS at a time) over one shared session.
+    """
+    _check_planets(planets)
+    if session is None:
+        with _new_session() as s:
+            return fetch_all_planets_range(planets, start_day, end_day, step_days, session=s)
+
+    with ThreadPoolExecutor(_MAX_CONCURRENT_REQUESTS) as pool:
+        lon_series = pool.map(
+            lambda p: fetch_geocentric_ecliptic_longitude_range(
+                PLANET_IDS[p], start_day, end_day, step_days, session=session),
+            planets,
+        )
+        return dict(zip(planets, lon_series))
+
+def compute_span_series(
+    start_day: date,
+    end_day: date,
+    planets: List[str],
+    step_days: int = 1,
+    max_span_deg: Optional[float] = None,
+    session: Optional[requests.Session] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (dates, spans) for start_day, start_day + step_days, ... up to end_day:
+    dates as datetime64[D] and the minimal arc covering all planet longitudes
+    on each of them. With max_span_deg, only spans up to it are exact; larger
+    ones may be inf or an upper bound (see _circular_span_deg_batch).
+    """
+    lons = fetch_all_planets_range(planets, start_day, end_day, step_days, session=session)
+
+    n_steps = (end_day - start_day).days // step_days + 1
+    dates = np.datetime64(start_day, "D") + np.arange(max(n_steps, 0)) * step_days
+    if not planets:
+        return dates, np.zeros(len(dates))
+    return dates, _circular_span_deg_batch(np.column_stack([lons[p] for p in planets]), max_span_deg)
 
 def list_planetary_alignments(
     start_day: date,
@@ -129,45 +292,20 @@ def list_planetary_alignments(
     Scan [start_day, end_day] inclusive and return alignment intervals where
     minimal arc covering all planet longitudes <= span_threshold_deg.
     """
-    for p in planets:
-        if p not in PLANET_IDS:
-            raise ValueError(f"Unknown planet name: {p}. Available: {list(PLANET_IDS.keys())}")
+    dates, spans = compute_span_series(start_day, end_day, planets,
+                                       max_span_deg=span_threshold_deg)
+    return [
+        AlignmentHit(dates[i].item(), dates[j - 1].item(), planets, float(spans[i:j].max()))
+        for i, j in _runs(spans <= span_threshold_deg)
+    ]
 
-    hits: List[Tuple[date, float]] = []
-    with requests.Session() as sess:
-        d = start_day
-        while d <= end_day:
-            lons = []
-            for p in planets:
-                lon = fetch_geocentric_ecliptic_longitude(PLANET_IDS[p], d, session=sess)
-                lons.append(lon)
-
-            span = _circular_span_deg(lons)
-            if span <= span_threshold_deg:
-                hits.append((d, span))
-            d += timedelta(days=1)
-
-    # Merge consecutive days into intervals
-    if not hits:
-        return []
-
-    intervals: List[AlignmentHit] = []
-    cur_start = hits[0][0]
-    cur_end = hits[0][0]
-    cur_max_span = hits[0][1]
-
-    for (d, span) in hits[1:]:
-        if d == cur_end + timedelta(days=1):
-            cur_end = d
-            cur_max_span = max(cur_max_span, span)
-        else:
-            intervals.append(AlignmentHit(cur_start, cur_end, planets, cur_max_span))
-            cur_start = d
-            cur_end = d
-            cur_max_span = span
-
-    intervals.append(AlignmentHit(cur_start, cur_end, planets, cur_max_span))
-    return intervals
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Return [start, stop) index pairs of the runs of True in mask: +1 edges of
+    the padded mask open a run, -1 edges close it.
+    """
+    edges = np.diff(np.concatenate([[0], mask.astype(int), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
 
 if __name__ == "__main__":
     # 例：2026年〜2028年の間で、7惑星（地球除く）の直列っぽい期間を探す
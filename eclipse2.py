@@ -1,10 +1,28 @@
+import importlib.util
 import math
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timedelta, date
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import requests_cache
+except ImportError:  # optional: without it every run goes to JPL
+    requests_cache = None
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib JSON parser
+    orjson = None
+
+# optional: numba is only imported once a scan is large enough to use scan_span
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
 
 HORIZONS_API = "https://ssd.jpl.nasa.gov/api/horizons.api"
 
@@ -19,7 +37,15 @@ PLANET_IDS = {
 }
 
 MU_SUN = 132712440041.93938  # km^3/s^2
-AU_KM = 149597870.700
+
+MAX_CONCURRENT_REQUESTS = 4  # simultaneous Horizons requests
+POOL_SIZE = 16  # pooled keep-alive connections per host
+HORIZONS_CACHE_PATH = "horizons.sqlite"  # used when requests_cache is installed
+EPOCH_BUCKET_MIN = 15  # element epochs are rounded down to this many minutes
+SCAN_SPAN_MIN_CANDIDATES = 1_000_000  # below this numba's import/JIT costs more than scan_span saves
+
+_BLOCK_RE = re.compile(r"\$\$SOE(?P<block>.*?)\$\$EOE", re.S)
+_NUMBER_RE = re.compile(r"^-?\d")
 
 @dataclass
 class Elements:
@@ -29,15 +55,33 @@ class Elements:
     w_deg: float
     M_deg: float
 
+@dataclass
+class ElementsTable:
+    # Elements を惑星方向に並べた列指向（SoA）版。各フィールドは惑星数の float64 配列
+    epoch_jd: np.ndarray
+    a_km: np.ndarray
+    Omega_deg: np.ndarray
+    w_deg: np.ndarray
+    M_deg: np.ndarray
+
+def to_table(elems: Dict[str, Elements]) -> ElementsTable:
+    vals = list(elems.values())
+    return ElementsTable(*(
+        np.fromiter((getattr(el, f) for el in vals), dtype=float, count=len(vals))
+        for f in ("epoch_jd", "a_km", "Omega_deg", "w_deg", "M_deg")
+    ))
+
+def jd_from_date(d: date) -> float:
+    # 0001-01-01 00:00 (ordinal 1) は JD 1721425.5
+    return d.toordinal() + 1721424.5
+
 def jd_from_datetime(dt: datetime) -> float:
-    y, m = dt.year, dt.month
-    d = dt.day + (dt.hour + dt.minute/60)/24
-    if m <= 2:
-        y -= 1
-        m += 12
-    A = y // 100
-    B = 2 - A + (A // 4)
-    return int(365.25*(y+4716)) + int(30.6001*(m+1)) + d + B - 1524.5
+    return jd_from_date(dt) + ((dt.hour*60 + dt.minute)*60 + dt.second)/86400.0
+
+def jd_from_array(dates: np.ndarray) -> np.ndarray:
+    # datetime64 配列をまとめて JD に変換（J2000.0 = 2000-01-01T12:00 = JD 2451545.0 基準）
+    us = (dates.astype("datetime64[us]") - np.datetime64("2000-01-01T12:00", "us")).astype(np.float64)
+    return us/86400e6 + 2451545.0
 
 def circular_span_deg(angles: List[float]) -> float:
     a = sorted([x % 360 for x in angles])
@@ -45,7 +89,90 @@ def circular_span_deg(angles: List[float]) -> float:
     gaps.append(a[0]+360-a[-1])
     return 360 - max(gaps)
 
+def circular_span_deg_batch(angles: np.ndarray, max_span_deg: Optional[float] = None) -> np.ndarray:
+    # angles: (日数, 惑星数) → 各行の最小被覆弧
+    if max_span_deg is None or max_span_deg >= 180:
+        a = np.sort(angles % 360, axis=1)
+        gaps = np.diff(a, axis=1)
+        wrap = (a[:, 0] + 360) - a[:, -1]
+        all_gaps = np.concatenate([gaps, wrap[:, None]], axis=1)
+        return 360 - all_gaps.max(axis=1)
+
+    # 三角関数は e^{iλ} として一度だけ評価し、集中度 R=|Σe^{iλ}|/N で前判定する。
+    # 幅 s(≤180°) の弧に収まる点は R ≥ cos(s/2) を満たすので、それ未満の行は inf とする。
+    # 残った行では平均方向 arg(z) が弧の内側にあるので、そこからの差で測れば折り返しが消え、
+    # max − min がそのまま span になる（ソート不要。max_span_deg を超える値は上界になるだけ）
+    rad = np.radians(angles)
+    z = np.exp(1j*rad).sum(axis=1)
+    keep = np.abs(z)/angles.shape[1] >= math.cos(math.radians(max_span_deg)/2) - 1e-9
+    spans = np.full(angles.shape[0], np.inf)
+    delta = (rad[keep] - np.angle(z[keep])[:, None] + math.pi) % (2*math.pi) - math.pi
+    spans[keep] = np.degrees(delta.max(axis=1) - delta.min(axis=1))
+    return spans
+
+prange = range  # scan_span で numba.prange に差し替える
+
+def _scan_span(jd, t0, lam0, n_arr):
+    # 候補ごとに λ0 + n·(t − t0) を小さな配列へ挿入ソートしながら積み、最大ギャップから span を出す。
+    # (候補数, 惑星数) の中間配列を作らない分、NumPy 版より軽い。
+    two_pi = 2*math.pi
+    P = lam0.shape[0]
+    out = np.empty(jd.shape[0])
+    for i in prange(jd.shape[0]):
+        a = np.empty(P)
+        for j in range(P):
+            x = (lam0[j] + n_arr[j]*(jd[i]-t0)) % two_pi
+            k = j
+            while k > 0 and a[k-1] > x:
+                a[k] = a[k-1]
+                k -= 1
+            a[k] = x
+        gap = a[0] + two_pi - a[P-1]
+        for j in range(P-1):
+            if a[j+1] - a[j] > gap:
+                gap = a[j+1] - a[j]
+        out[i] = math.degrees(two_pi - gap)
+    return out
+
+_scan_span_jit = None
+
+def scan_span(jd, t0, lam0, n_arr):
+    # 初回呼び出し時に numba を import して _scan_span を並列カーネルへコンパイルする
+    global prange, _scan_span_jit
+    if _scan_span_jit is None:
+        import numba
+        prange = numba.prange
+        _scan_span_jit = numba.njit(parallel=True, fastmath=True, cache=True)(_scan_span)
+    return _scan_span_jit(jd, t0, lam0, n_arr)
+
+def new_session() -> requests.Session:
+    # requests_cache があれば Horizons の応答を SQLite に永続化する（期限なし）
+    if requests_cache is not None:
+        sess = requests_cache.CachedSession(HORIZONS_CACHE_PATH, backend="sqlite", expire_after=-1)
+    else:
+        sess = requests.Session()
+    # 接続はプールして使い回し、Horizons がときどき返す 429/5xx はバックオフ付きで再試行する
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    sess.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry))
+    sess.headers["Accept-Encoding"] = "gzip"
+    return sess
+
+def _load_json(r):
+    # 応答は巨大な "result" 文字列 1 つなので、orjson があればそちらでデコードする
+    return orjson.loads(r.content) if orjson is not None else r.json()
+
+_elements_cache: Dict[Tuple[str, datetime], Elements] = {}
+
 def fetch_elements(body_id: str, epoch_dt: datetime, sess) -> Elements:
+    # Round the epoch so nearby requests share one parsed result.
+    epoch_dt = epoch_dt.replace(second=0, microsecond=0)
+    epoch_dt -= timedelta(minutes=epoch_dt.minute % EPOCH_BUCKET_MIN)
+    key = (body_id, epoch_dt)
+    if key not in _elements_cache:
+        _elements_cache[key] = _fetch_elements(body_id, epoch_dt, sess)
+    return _elements_cache[key]
+
+def _fetch_elements(body_id: str, epoch_dt: datetime, sess) -> Elements:
     epoch = epoch_dt.strftime("%Y-%m-%d %H:%M")
     epoch_jd = jd_from_datetime(epoch_dt)
 
@@ -57,58 +184,39 @@ def fetch_elements(body_id: str, epoch_dt: datetime, sess) -> Elements:
         "START_TIME":f"'{epoch}'",
         "STOP_TIME":f"'{epoch}'",
         "STEP_SIZE":"'1 d'",
+        "OUT_UNITS":"'KM-S'",
         "CSV_FORMAT":"YES"
     }
 
     r = sess.get(HORIZONS_API, params=params)
-    txt = r.json()["result"]
+    txt = _load_json(r)["result"]
 
-    def f(p): 
-        return float(re.search(p, txt).group(1))
+    m_block = _BLOCK_RE.search(txt)
+    if not m_block:
+        raise ValueError("Could not find $$SOE/$$EOE block in Horizons output.")
 
-    # Try to get semimajor axis A (in AU) in a format‑tolerant way
-    m_au = re.search(r"(?i)\bA\s*=\s*([0-9Ee\+\-\.]+)\s*[Aa][Uu]\b", txt)
+    # The CSV header is the last comma-separated line above $$SOE
+    # (Horizons puts a row of asterisks between the two).
+    header = next((ln for ln in reversed(txt[:m_block.start()].splitlines()) if "," in ln), None)
+    lines = [ln for ln in m_block.group("block").splitlines() if ln.strip()]
+    if header is None or not lines:
+        raise ValueError("Unexpected Horizons CSV format (missing header or data line).")
 
-    if m_au:
-        a_km = float(m_au.group(1)) * AU_KM
-    else:
-        # Fallback: parse from the CSV block between $$SOE / $$EOE
-        m_block = re.search(r"\$\$SOE(.*?)\$\$EOE", txt, re.S)
-        if not m_block:
-            raise ValueError("Could not find semimajor axis (A) in Horizons output.")
-
-        lines = [ln.strip() for ln in m_block.group(1).strip().splitlines() if ln.strip()]
-        if len(lines) < 2:
-            raise ValueError("Unexpected Horizons CSV format (not enough lines).")
-
-        header = [h.strip() for h in lines[0].split(",")]
-        data = [d.strip() for d in lines[1].split(",")]
-
-        a_index = None
-        for i, h in enumerate(header):
-            name = h.upper()
-            if name == "A" or name.startswith("A(") or name.startswith("A "):
-                a_index = i
-                break
-
-        if a_index is None or a_index >= len(data):
-            raise ValueError("Could not locate semimajor axis column 'A' in Horizons CSV.")
-
-        a_km = float(data[a_index]) * AU_KM
-
-    return Elements(
-        epoch_jd,
-        a_km,
-        f(r"OM\s*=\s*([0-9Ee\+\-\.]+)"),
-        f(r"W\s*=\s*([0-9Ee\+\-\.]+)"),
-        f(r"MA\s*=\s*([0-9Ee\+\-\.]+)")
-    )
+    idx = {h.strip().upper(): i for i, h in enumerate(header.split(","))}
+    row = lines[0].split(",")
+    try:
+        a_km, Omega, w, M = (float(row[idx[name]]) for name in ("A", "OM", "W", "MA"))
+    except (KeyError, IndexError) as e:
+        raise ValueError(f"Could not locate element column {e} in Horizons CSV.") from None
 
+    return Elements(epoch_jd, a_km, Omega, w, M)
+
+# どちらもスカラー（Elements / float）でも配列（ElementsTable / ndarray）でも使える
 def mean_motion(a_km):
-    return math.sqrt(MU_SUN/(a_km**3))*86400
+    return np.sqrt(MU_SUN/(a_km**3))*86400
 
 def mean_longitude(el):
-    return math.radians((el.Omega_deg+el.w_deg+el.M_deg)%360)
+    return np.radians((el.Omega_deg+el.w_deg+el.M_deg)%360)
 
 def fetch_lon(body_id, jd, sess):
     params={
@@ -121,10 +229,10 @@ def fetch_lon(body_id, jd, sess):
         "CSV_FORMAT":"YES"
     }
     r=sess.get(HORIZONS_API,params=params)
-    txt=r.json()["result"]
-    m=re.search(r"\$\$SOE(.*?)\$\$EOE",txt,re.S)
-    line=m.group(1).strip().splitlines()[0]
-    vals=[float(v) for v in line.split(",") if re.match(r"^-?\d",v)]
+    txt=_load_json(r)["result"]
+    m=_BLOCK_RE.search(txt)
+    line=m.group("block").strip().splitlines()[0]
+    vals=[float(v) for v in line.split(",") if _NUMBER_RE.match(v)]
     return vals[-2]%360
 
 def main():
@@ -133,34 +241,43 @@ def main():
     span_thresh=10
     planets=list(PLANET_IDS.keys())
     ref="Jupiter"
+    seed="Mars"
 
     mid=datetime(2027,1,1)
 
-    with requests.Session() as sess:
-        elems={}
-        for p in planets:
-            elems[p]=fetch_elements(PLANET_IDS[p],mid,sess)
-
-        lam={p:mean_longitude(elems[p]) for p in planets}
-        n={p:mean_motion(elems[p].a_km) for p in planets}
-        t0=elems[ref].epoch_jd
-
-        # 候補生成（Mars基準）
-        seed="Mars"
-        cand=[]
-        for k in range(-200,200):
-            t=t0+(lam[ref]-lam[seed]+2*math.pi*k)/(n[seed]-n[ref])
-            if jd_from_datetime(datetime(start.year,start.month,start.day))<=t<=jd_from_datetime(datetime(end.year,end.month,end.day)):
-                cand.append(t)
-
-        print("Analytic candidates:",len(cand))
-
-        hits=[]
-        for jd in cand:
-            lons=[fetch_lon(PLANET_IDS[p],jd,sess) for p in planets]
-            span=circular_span_deg(lons)
-            if span<=span_thresh:
-                hits.append((jd,span))
+    with new_session() as sess, ThreadPoolExecutor(MAX_CONCURRENT_REQUESTS) as pool:
+        # 惑星ごとのリクエストは独立なので並列に投げる
+        elems=dict(zip(planets,pool.map(lambda p:fetch_elements(PLANET_IDS[p],mid,sess),planets)))
+
+    # 平均黄経・平均運動は惑星方向のベクトル演算でまとめて求める
+    tbl=to_table(elems)
+    lam0=mean_longitude(tbl)
+    n_arr=mean_motion(tbl.a_km)
+    i_ref,i_seed=planets.index(ref),planets.index(seed)
+    t0=tbl.epoch_jd[i_ref]
+
+    # 候補生成（Mars基準）
+    jd_lo=jd_from_date(start)
+    jd_hi=jd_from_date(end)
+    # seed と ref の会合は t_base から会合周期 T_syn ごとに起きるので、窓に入る k だけを直接列挙する
+    delta_n=n_arr[i_seed]-n_arr[i_ref]
+    T_syn=2*math.pi/abs(delta_n)
+    t_base=t0+(lam0[i_ref]-lam0[i_seed])/delta_n
+    k_lo=math.ceil((jd_lo-t_base)/T_syn)
+    k_hi=math.floor((jd_hi-t_base)/T_syn)
+    cand=[t_base+k*T_syn for k in range(k_lo,k_hi+1)]
+
+    print("Analytic candidates:",len(cand))
+
+    # 候補日の平均黄経は λ(t) = λ0 + n·(t − t0) で解析的に求める（Horizons へは問い合わせない）
+    jd=np.array(cand,dtype=float)
+    if HAVE_NUMBA and len(jd)>=SCAN_SPAN_MIN_CANDIDATES:
+        spans=scan_span(jd,t0,lam0,n_arr)
+    else:
+        theta=lam0[None,:]+n_arr[None,:]*(jd-t0)[:,None]  # (候補数, 惑星数)
+        spans=circular_span_deg_batch(np.degrees(theta),span_thresh)
+
+    hits=[(t,span) for t,span in zip(jd,spans) if span<=span_thresh]
 
     print("Hits:",len(hits))
     for jd,span in hits:
@@ -0,0 +1,114 @@
+import contextlib
+import math
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import eclipse
+import eclipse2
+
+EPOCH = date(2026, 1, 1)
+
+
+def _synthetic_motion(seed):
+    """
+    Per-planet (base, rate, amp, period, phase) of a steady drift with
+    periodic retrograde stretches.
+    """
+    rng = np.random.default_rng(seed)
+    motion = {}
+    for body_id in eclipse.PLANET_IDS.values():
+        rate = rng.uniform(0.05, 1.0)
+        period = rng.uniform(50.0, 400.0)
+        amp = 1.4 * rate * period / (2.0 * math.pi)
+        motion[body_id] = (rng.uniform(0.0, 360.0), rate, amp, period,
+                           rng.uniform(0.0, 2.0 * math.pi))
+    return motion
+
+
+def _lon(motion, body_id, t):
+    base, rate, amp, period, phase = motion[body_id]
+    return (base + rate * t + amp * np.sin(2.0 * math.pi * t / period + phase)) % 360.0
+
+
+@pytest.fixture
+def fake_horizons(monkeypatch):
+    calls = []
+    motion = {}
+
+    def fetch(body_id, start_day, end_day, step_days=1, session=None):
+        calls.append((body_id, start_day, end_day, step_days))
+        t = (start_day - EPOCH).days + np.arange((end_day - start_day).days // step_days + 1) * step_days
+        return _lon(motion, body_id, t)
+
+    monkeypatch.setattr(eclipse, "fetch_geocentric_ecliptic_longitude_range", fetch)
+    monkeypatch.setattr(eclipse, "_new_session", lambda: contextlib.nullcontext(object()))
+    return motion, calls
+
+
+def _brute_force_days(motion, start_day, end_day, planets, threshold):
+    days = []
+    for i in range((end_day - start_day).days + 1):
+        t = (start_day - EPOCH).days + i
+        lons = [_lon(motion, eclipse.PLANET_IDS[p], t) for p in planets]
+        if eclipse._circular_span_deg(lons) <= threshold:
+            days.append(start_day + timedelta(days=i))
+    return days
+
+
+def _hit_days(hits):
+    days = []
+    for h in hits:
+        d = h.start
+        while d <= h.end:
+            days.append(d)
+            d += timedelta(days=1)
+    return days
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("planets", [
+    ["Mercury", "Venus"],
+    ["Mercury", "Venus", "Mars"],
+    ["Mars", "Jupiter", "Saturn", "Uranus"],
+    list(eclipse.PLANET_IDS),
+])
+def test_alignments_match_daily_brute_force(fake_horizons, seed, planets):
+    motion, _ = fake_horizons
+    motion.update(_synthetic_motion(seed))
+    start_day, end_day = date(2026, 1, 3), date(2028, 12, 29)
+
+    for threshold in (10.0, 30.0, 60.0, 120.0, 170.0):
+        hits = eclipse.list_planetary_alignments(start_day, end_day, planets, threshold)
+        expected = _brute_force_days(motion, start_day, end_day, planets, threshold)
+        assert _hit_days(hits) == expected
+
+
+@pytest.mark.parametrize("span_batch", [eclipse._circular_span_deg_batch, eclipse2.circular_span_deg_batch])
+@pytest.mark.parametrize("max_span_deg", [0.5, 1.0, 10.0, 45.0, 90.0, 170.0, 179.9])
+def test_thresholded_span_batch_matches_sorted_spans(span_batch, max_span_deg):
+    rng = np.random.default_rng(0)
+    # 50k days of 7 planets clustered around a random centre, about half of them within the threshold.
+    centre = rng.uniform(-360.0, 360.0, size=(50000, 1))
+    angles = centre + rng.uniform(0.0, 1.3 * max_span_deg, size=(50000, 7))
+
+    exact = span_batch(angles)
+    spans = span_batch(angles, max_span_deg)
+
+    within = exact <= max_span_deg
+    np.testing.assert_array_equal(spans <= max_span_deg, within)
+    np.testing.assert_allclose(spans[within], exact[within], atol=1e-9)
+    # Spans above the threshold are inf or an upper bound, never an underestimate.
+    assert np.all(spans >= exact - 1e-9)
+
+
+def test_window_within_one_query_is_scanned_daily_once(fake_horizons):
+    motion, calls = fake_horizons
+    motion.update(_synthetic_motion(0))
+    planets = ["Mercury", "Venus"]
+
+    eclipse.list_planetary_alignments(date(2026, 1, 1), date(2028, 12, 31), planets, 10.0)
+
+    assert len(calls) == len(planets)
+    assert all(step == 1 for (_, _, _, step) in calls)
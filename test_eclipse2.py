@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import eclipse2
+
+
+def test_span_batch_matches_scalar_span():
+    rng = np.random.default_rng(1)
+    angles = rng.uniform(-400.0, 800.0, size=(1000, 7))
+
+    expected = [eclipse2.circular_span_deg(list(row)) for row in angles]
+    np.testing.assert_allclose(eclipse2.circular_span_deg_batch(angles), expected, atol=1e-9)
+
+
+def _kernel_inputs():
+    rng = np.random.default_rng(2)
+    lam0 = rng.uniform(0.0, 2.0 * np.pi, size=7)
+    n_arr = rng.uniform(1e-4, 0.08, size=7)
+    jd = 2461041.5 + rng.uniform(0.0, 1500.0, size=1000)
+    t0 = 2461406.5
+    expected = eclipse2.circular_span_deg_batch(np.degrees(lam0[None, :] + n_arr[None, :] * (jd - t0)[:, None]))
+    return (jd, t0, lam0, n_arr), expected
+
+
+def test_scan_span_kernel_matches_span_batch():
+    args, expected = _kernel_inputs()
+    np.testing.assert_allclose(eclipse2._scan_span(*args), expected, atol=1e-9)
+
+
+def test_compiled_scan_span_matches_span_batch():
+    pytest.importorskip("numba")
+    args, expected = _kernel_inputs()
+    np.testing.assert_allclose(eclipse2.scan_span(*args), expected, atol=1e-9)